@@ -0,0 +1,209 @@
+# data_fetch.py
+# 行情数据引擎：按标的落地 Parquet 缓存，重启后只补拉缺失的尾部数据
+# 下游只用收盘价，因此只拉取/存储 Close，返回宽表: 行 = 日期, 列 = 代码
+# 缓存较新时直接读盘返回，过期的标的转到后台线程刷新 (stale-while-revalidate)，页面不等网络
+# FRED 宏观序列另存一张整表，按时效整体刷新
+
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+import yfinance as yf
+
+CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "prices"
+PRICE_FRESH_AGE = 15 * 60 # 秒：此时间内校验过的缓存视为最新，不发请求
+PRICE_STALE_AGE = 4 * 3600 # 秒：超过则不再先返回旧数据，同步补拉
+FRED_CACHE = CACHE_DIR.parent / "fred.parquet"
+FRED_MAX_AGE = 12 * 3600 # 秒
+
+
+def _fetch(ticker, start, end):
+    # Ticker.history 不经过 yf.download 的全局结果表，可以安全地多线程并发
+    # 请求失败 (网络/限流/退市) 返回 None，与 "请求成功但区间内没有数据" 的空表区分开
+    try:
+        hist = yf.Ticker(ticker).history(start=start, end=end, auto_adjust=True)
+    except Exception:
+        return None
+    if hist.empty:
+        return pd.DataFrame()
+    if hist.index.tz is not None:
+        hist.index = hist.index.tz_localize(None)
+    hist.index = hist.index.normalize()
+    return hist[["Close"]]
+
+
+def _read_cache(ticker):
+    path = CACHE_DIR / f"{ticker}.parquet"
+    if not path.exists():
+        return pd.DataFrame()
+    try:
+        return pd.read_parquet(path, columns=["Close"])
+    except Exception:
+        return pd.DataFrame() # 缓存文件损坏：当作无缓存整段重拉，不连累其他标的
+
+
+def _cache_age(ticker):
+    path = CACHE_DIR / f"{ticker}.parquet"
+    return time.time() - path.stat().st_mtime if path.exists() else None
+
+
+def _covers(cached, start_date):
+    # 文件元数据记录了当初拉取的起点 (since)：请求起点不早于它即视为覆盖，
+    # 上市晚于起点的标的 (如 XLC) 首根 K 线永远晚于 since，不能按首个日期判断，否则每次都整段重拉
+    if cached.empty:
+        return False
+    since = cached.attrs.get("since")
+    first = pd.Timestamp(since) if since else cached.index[0] # 旧缓存文件没有元数据：退回按首个日期判断
+    return first <= pd.Timestamp(start_date) + pd.Timedelta(days=7)
+
+
+def _write_parquet(data, path):
+    # 先写同目录临时文件再原子替换：后台刷新与其他会话并发写同一文件时，读方只会看到完整的旧文件或新文件
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        data.to_parquet(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _load_ticker(ticker, start_date, end_date):
+    path = CACHE_DIR / f"{ticker}.parquet"
+    cached = _read_cache(ticker)
+
+    # 缓存覆盖不到起点 (或没有缓存)：整段拉取
+    if not _covers(cached, start_date):
+        since = pd.Timestamp(start_date)
+        data = _fetch(ticker, since, end_date)
+    else:
+        since = pd.Timestamp(cached.attrs.get("since", cached.index[0]))
+        # 从倒数第二根 K 线开始补拉，用这根已收盘的重叠数据校验复权是否变化
+        anchor = cached.index[-2] if len(cached) > 1 else cached.index[-1]
+        delta = _fetch(ticker, anchor, end_date)
+        if delta is None or delta.empty:
+            # 补拉从重叠的 anchor 开始，成功时至少会返回重叠行：拿不到数据即说明这次请求失败
+            # 失败的刷新必须保留原 mtime (不 touch)，文件才会照常变旧，超过 PRICE_STALE_AGE 后转入同步拉取
+            return cached.loc[pd.Timestamp(start_date):, "Close"]
+        if anchor in delta.index and np.isclose(delta.at[anchor, "Close"], cached.at[anchor, "Close"], rtol=1e-6):
+            data = pd.concat([cached, delta])
+            data = data[~data.index.duplicated(keep="last")]
+            if data.equals(cached):
+                data = cached # 重叠校验通过且没有新 K 线：不重写文件，只刷新时间戳
+        else:
+            # 期间发生分红/拆股，历史复权价已变，从文件原起点整段重拉 (不缩短已覆盖的区间)
+            since = min(since, pd.Timestamp(start_date))
+            data = _fetch(ticker, since, end_date)
+
+    if data is None or data.empty:
+        return pd.Series(dtype=float)
+    try:
+        if data is not cached:
+            data.attrs["since"] = since.isoformat() # 随 Parquet 元数据落盘，供 _covers 判断覆盖范围
+            _write_parquet(data, path)
+        else:
+            path.touch() # 请求成功且重叠行一致、数据没变：刷新时间戳，记录本次已校验
+    except OSError:
+        pass # 只读环境下跳过落盘
+    return data.loc[pd.Timestamp(start_date):, "Close"]
+
+
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+
+def _refresh_in_background(tickers, start_date, end_date, max_workers):
+    # 同一标的同时只有一个后台刷新；刷新结果只写盘，下次读取时生效
+    with _refresh_lock:
+        todo = [t for t in tickers if t not in _refreshing]
+        _refreshing.update(todo)
+    if not todo:
+        return
+
+    def run():
+        try:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(todo))) as ex:
+                list(ex.map(lambda t: _load_ticker(t, start_date, end_date), todo))
+        finally:
+            with _refresh_lock:
+                _refreshing.difference_update(todo)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _to_wide(frames):
+    frames = {t: s for t, s in frames.items() if not s.empty}
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, axis=1).sort_index()
+
+
+def load_closes(tickers, start_date, end_date, max_workers=16):
+    if not tickers:
+        return pd.DataFrame()
+
+    # 逐个标的判断：缓存覆盖起点且不算太旧的直接读盘，过了新鲜期的转后台刷新；
+    # 只有无缓存/覆盖不到起点/过旧的标的才同步拉取，个别失效或新上市的标的不拖累整批
+    frames, stale, missing = {}, [], []
+    for t in tickers:
+        age = _cache_age(t)
+        cached = _read_cache(t) if age is not None and age < PRICE_STALE_AGE else pd.DataFrame()
+        if _covers(cached, start_date):
+            frames[t] = cached.loc[pd.Timestamp(start_date):, "Close"]
+            if age >= PRICE_FRESH_AGE:
+                stale.append(t)
+        else:
+            missing.append(t)
+    if stale:
+        _refresh_in_background(stale, start_date, end_date, max_workers)
+
+    if missing:
+        # 纯网络 I/O，线程数按标的数量给足 (上限 16)，冷启动时所有请求并发
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as ex:
+            frames.update(zip(missing, ex.map(lambda t: _load_ticker(t, start_date, end_date), missing)))
+    return _to_wide({t: frames[t] for t in tickers if t in frames})
+
+
+@st.cache_data(ttl=PRICE_FRESH_AGE, show_spinner=False)
+def fetch_prices(tickers, days):
+    # 各页面共用的内存缓存入口：键为 (代码元组, 回看天数)，同一请求跨页面/会话只拉一次
+    # TTL 与新鲜期一致：过期后重读磁盘 (很快)，后台刷新写回的数据在下一个周期即可上屏，不会被内存缓存压住
+    end_date = datetime.now()
+    return load_closes(tickers, end_date - timedelta(days=days), end_date)
+
+
+def load_fred(codes, start_date, end_date, max_age=FRED_MAX_AGE):
+    # FRED 数据发布有滞后且会修订，不做增量拼接：整表落盘，未过期且覆盖所需代码/起点时直接读盘
+    codes = list(codes)
+    cached = pd.DataFrame()
+    if FRED_CACHE.exists():
+        try:
+            cached = pd.read_parquet(FRED_CACHE)
+        except Exception:
+            pass # 缓存文件损坏：当作无缓存
+    covers = not cached.empty and set(codes) <= set(cached.columns) and cached.index[0] <= pd.Timestamp(start_date) + pd.Timedelta(days=31)
+    if covers and time.time() - FRED_CACHE.stat().st_mtime < max_age:
+        return cached.loc[pd.Timestamp(start_date):, codes]
+
+    try:
+        import pandas_datareader.data as web # 只有资金池页用到，延迟导入，其他页面不受其依赖影响
+        data = web.DataReader(codes, 'fred', start_date, end_date)
+    except Exception:
+        # 拉取失败时退回旧缓存 (即使已过期)，都没有再交给调用方处理
+        if covers:
+            return cached.loc[pd.Timestamp(start_date):, codes]
+        raise
+    try:
+        _write_parquet(data, FRED_CACHE)
+    except OSError:
+        pass # 只读环境下跳过落盘
+    return data
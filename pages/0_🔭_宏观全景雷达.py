@@ -1,8 +1,9 @@
 import streamlit as st
 import pandas as pd
-import yfinance as yf
+import numpy as np
+from data_fetch import fetch_prices
+from radar_engine import classify_structure, compute_radar, show_radar_groups, split_group_traces
 import plotly.express as px
-from datetime import datetime, timedelta
 
 # 页面配置
 st.set_page_config(page_title="宏观全景雷达", layout="wide")
@@ -51,118 +52,102 @@ ASSET_GROUPS = {
     }
 }
 
+# 去重后的全部代码 (模块常量，导入时算一次)
+ALL_TICKERS = tuple(sorted({ticker for group in ASSET_GROUPS.values() for ticker in group}))
+# 代码 -> 名称/组别 的反查表 (同一代码出现在多个组别时各占一行)，取代每次计算时逐组扫描
+TICKER_META = pd.DataFrame(
+    [(ticker, name, group_name) for group_name, tickers in ASSET_GROUPS.items() for ticker, name in tickers.items()],
+    columns=["代码", "名称", "组别"]
+).astype({"组别": pd.CategoricalDtype(list(ASSET_GROUPS))})
+
 # --- 2. 数据引擎 ---
-@st.cache_data(ttl=3600*4)
 def get_data():
-    all_tickers = []
-    for group in ASSET_GROUPS.values():
-        all_tickers.extend(list(group.keys()))
-    all_tickers = list(set(all_tickers))
-    
-    end_date = datetime.now()
-    # 必须拉取足够长的数据以计算 EMA200
-    start_date = end_date - timedelta(days=730) 
-    
+    # 必须拉取足够长的数据以计算 EMA200 (730 天)；缓存在 fetch_prices 内，与其他页面共用
     try:
-        data = yf.download(all_tickers, start=start_date, end=end_date, progress=False, group_by='ticker')
+        data = fetch_prices(ALL_TICKERS, 730)
         return data
-    except: return pd.DataFrame()
+    except Exception: return pd.DataFrame()
 
 raw_data = get_data()
 
 # --- 3. 计算逻辑 (深度趋势解析 + L/VL) ---
-def calculate_metrics():
-    metrics = []
+# 趋势结构文案 (判定逻辑见 radar_engine.classify_structure)，顺序: 完美多头, 完美空头, 牛市回调, 长期看涨, 熊市反弹, 长期看跌, 震荡
+STRUCTURE_LABELS = (
+    "完美多头 (主升浪)",
+    "完美空头 (主跌浪)",
+    "牛市回调 (多头排列)",
+    "长期看涨",
+    "熊市反弹 (空头排列)",
+    "长期看跌",
+    "震荡/纠缠",
+)
+
+@st.cache_data(ttl=3600*4, show_spinner=False)
+def calculate_metrics(raw_data):
+    # 数值指标由共用引擎计算 (未取整)，本页只负责结构标签与元数据
+    stats, spy_mom20 = compute_radar(raw_data) # raw_data 即收盘价宽表 (列 = 代码)
+    # 结构判定基于未取整的乖离率，避免 0 附近被四舍五入改变方向
+    stats.insert(3, "趋势结构", classify_structure(stats, STRUCTURE_LABELS))
+    stats = stats.round(2) # 整表一次取整 (字符串列自动跳过)
+
+    df = TICKER_META.join(stats, on="代码", how="inner").reset_index(drop=True)
+    # 2 位小数的指标用 float32、重复字符串用 category，缩小缓存体积和前端 JSON (现价保留 float64，BTC 量级需要精度)
+    df = df.astype({**dict.fromkeys(["Z-Score", "相对强度", "绝对涨幅", "C/S", "S/M", "M/L", "L/VL"], "float32"), "趋势结构": "category"})
+    return df, spy_mom20
+
+@st.cache_data(ttl=3600*4, show_spinner=False)
+def build_radar_fig(df_metrics, benchmark_mom):
+    fig = px.scatter(
+        df_metrics, 
+        x="Z-Score", 
+        y="相对强度", 
+        color="相对强度",
+        text="名称",
+        hover_data={
+            "代码": True,
+            "趋势结构": True,
+            "Z-Score": ":.2f",
+            "相对强度": ":.2f",
+            "名称": False,
+            "相对强度": False
+        },
+        color_continuous_scale="RdYlGn", 
+        range_color=[-10, 10],
+        render_mode="webgl"
+    )
     
-    # 0. 计算基准 SPY
-    try:
-        if isinstance(raw_data.columns, pd.MultiIndex):
-            spy_df = raw_data['SPY']['Close'].dropna()
-        else:
-            spy_df = raw_data['Close'].dropna()
-        spy_mom20 = (spy_df.iloc[-1] / spy_df.iloc[-21] - 1) * 100
-    except:
-        spy_mom20 = 0
+    fig.add_hline(y=0, line_dash="dash", line_color="#FFFFFF", opacity=0.5, line_width=1)
+    fig.add_vline(x=0, line_dash="dash", line_color="#FFFFFF", opacity=0.3, line_width=1)
+    fig.update_traces(textposition='top center', marker=dict(size=8, line=dict(width=0), opacity=0.9))
     
-    for group_name, tickers in ASSET_GROUPS.items():
-        for ticker, name in tickers.items():
-            try:
-                if isinstance(raw_data.columns, pd.MultiIndex):
-                    if ticker not in raw_data.columns.levels[0]: continue
-                    df_t = raw_data[ticker]['Close'].dropna()
-                else:
-                    df_t = raw_data['Close'].dropna()
-
-                if len(df_t) < 250: continue # 提高门槛以计算 EMA200
-                
-                curr = df_t.iloc[-1]
-                
-                # --- A. 基础雷达指标 ---
-                ma250 = df_t.rolling(250, min_periods=200).mean().iloc[-1]
-                std250 = df_t.rolling(250, min_periods=200).std().iloc[-1]
-                z_score = (curr - ma250) / std250 if std250 != 0 else 0
-                
-                abs_mom20 = (curr / df_t.iloc[-21] - 1) * 100
-                rel_mom20 = abs_mom20 - spy_mom20
-                
-                # --- B. 深度趋势指标 (EMA系统) ---
-                # 计算 EMA 20, 60, 120, 200 (新增)
-                ema20 = df_t.ewm(span=20, adjust=False).mean().iloc[-1]
-                ema60 = df_t.ewm(span=60, adjust=False).mean().iloc[-1]
-                ema120 = df_t.ewm(span=120, adjust=False).mean().iloc[-1]
-                ema200 = df_t.ewm(span=200, adjust=False).mean().iloc[-1] # 新增超长均线
-                
-                # 计算乖离率 (Bias)
-                # C/S: Close vs Short (20)
-                c_s = (curr - ema20) / ema20 * 100
-                # S/M: Short (20) vs Medium (60)
-                s_m = (ema20 - ema60) / ema60 * 100
-                # M/L: Medium (60) vs Long (120)
-                m_l = (ema60 - ema120) / ema120 * 100
-                # L/VL: Long (120) vs Very Long (200) <--- 新增指标
-                l_vl = (ema120 - ema200) / ema200 * 100
-                
-                # 定义趋势结构 (Structure)
-                # 逻辑升级：加入 VL (200日) 的判断
-                structure = "震荡/纠缠"
-                
-                if c_s > 0 and s_m > 0 and m_l > 0 and l_vl > 0:
-                    structure = "完美多头 (主升浪)"
-                elif c_s < 0 and s_m < 0 and m_l < 0 and l_vl < 0:
-                    structure = "完美空头 (主跌浪)"
-                elif l_vl > 0:
-                    if c_s < 0: structure = "牛市回调 (多头排列)"
-                    else: structure = "长期看涨"
-                elif l_vl < 0:
-                    if c_s > 0: structure = "熊市反弹 (空头排列)"
-                    else: structure = "长期看跌"
-                
-                metrics.append({
-                    "代码": ticker, 
-                    "名称": name, 
-                    "组别": group_name,
-                    "Z-Score": round(z_score, 2), 
-                    "相对强度": round(rel_mom20, 2), 
-                    "趋势结构": structure,
-                    "C/S": round(c_s, 2),
-                    "S/M": round(s_m, 2),
-                    "M/L": round(m_l, 2),
-                    "L/VL": round(l_vl, 2), # 新增列
-                    "现价": round(curr, 2)
-                })
-            except: continue
-            
-    return pd.DataFrame(metrics), spy_mom20
+    fig.update_layout(
+        height=700,
+        title=dict(text=f"宏观全景雷达 (基准: SPY {benchmark_mom:.2f}%)", x=0.5),
+        xaxis_title="便宜 (低 Z-Score)  <───>  昂贵 (高 Z-Score)",
+        yaxis_title="跑输大盘 (弱)  <───>  跑赢大盘 (强)",
+        plot_bgcolor="#111111", 
+        paper_bgcolor="#111111",
+        font=dict(color="#ddd", size=12),
+        xaxis=dict(showgrid=True, gridcolor="#222"), 
+        yaxis=dict(showgrid=True, gridcolor="#222"),
+        coloraxis_colorbar=dict(title="相对强度%"),
+        uirevision="radar" # 重跑/切换筛选时保留用户的缩放与平移，前端不整图重排
+    )
+    
+    return split_group_traces(fig, df_metrics['组别'])
 
 # --- 4. 绘图与展示 ---
 if not raw_data.empty:
-    df_metrics, benchmark_mom = calculate_metrics()
+    df_metrics, benchmark_mom = calculate_metrics(raw_data)
     
     if not df_metrics.empty:
         # --- 侧边栏 ---
         with st.sidebar:
             st.header("资产筛选")
             st.metric("基准 (SPY) 20日涨跌", f"{benchmark_mom:.2f}%")
+            # 历史不足一个窗口的标的已在计算时整列剔除，这里列出来，避免静默丢失
+            skipped = sorted(set(TICKER_META["代码"]) - set(df_metrics["代码"]))
+            if skipped: st.caption(f"数据不足未纳入: {', '.join(skipped)}")
             
             all_groups = list(ASSET_GROUPS.keys())
             selected_groups = st.multiselect("显示资产组别：", all_groups, default=all_groups)
@@ -180,78 +165,34 @@ if not raw_data.empty:
         df_plot = df_metrics[df_metrics['组别'].isin(selected_groups)]
         
         # --- PART 1: 宏观雷达图 ---
-        fig = px.scatter(
-            df_plot, 
-            x="Z-Score", 
-            y="相对强度", 
-            color="相对强度",
-            text="名称",
-            hover_data={
-                "代码": True,
-                "趋势结构": True,
-                "Z-Score": ":.2f",
-                "相对强度": ":.2f",
-                "名称": False,
-                "相对强度": False
-            },
-            color_continuous_scale="RdYlGn", 
-            range_color=[-10, 10]
-        )
-        
-        fig.add_hline(y=0, line_dash="dash", line_color="#FFFFFF", opacity=0.5, line_width=1)
-        fig.add_vline(x=0, line_dash="dash", line_color="#FFFFFF", opacity=0.3, line_width=1)
-        fig.update_traces(textposition='top center', marker=dict(size=8, line=dict(width=0), opacity=0.9))
-        
-        if not df_plot.empty:
-            max_y = max(df_plot['相对强度'].max(), 5)
-            min_y = min(df_plot['相对强度'].min(), -5)
-            max_x = max(df_plot['Z-Score'].max(), 2)
-            min_x = min(df_plot['Z-Score'].min(), -2)
-
-            fig.add_annotation(x=max_x, y=max_y, text="领涨/拥挤", showarrow=False, font=dict(color="#E74C3C", size=12))
-            fig.add_annotation(x=min_x, y=min_y, text="滞涨/弱势", showarrow=False, font=dict(color="#3498DB", size=12))
-            fig.add_annotation(x=min_x, y=max_y, text="抗跌/启动", showarrow=False, font=dict(color="#2ECC71", size=12))
-            fig.add_annotation(x=max_x, y=min_y, text="补跌/崩盘", showarrow=False, font=dict(color="#E67E22", size=12))
-        
-        fig.update_layout(
-            height=700,
-            title=dict(text=f"宏观全景雷达 (基准: SPY {benchmark_mom:.2f}%)", x=0.5),
-            xaxis_title="便宜 (低 Z-Score)  <───>  昂贵 (高 Z-Score)",
-            yaxis_title="跑输大盘 (弱)  <───>  跑赢大盘 (强)",
-            plot_bgcolor="#111111", 
-            paper_bgcolor="#111111",
-            font=dict(color="#ddd", size=12),
-            xaxis=dict(showgrid=True, gridcolor="#222"), 
-            yaxis=dict(showgrid=True, gridcolor="#222"),
-            coloraxis_colorbar=dict(title="相对强度%")
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+        # 底图按全部标的缓存 (随数据刷新才重建)，切换组别只改轨迹可见性与象限标注
+        st.plotly_chart(show_radar_groups(build_radar_fig(df_metrics, benchmark_mom), df_plot, selected_groups), use_container_width=True)
         
         # --- PART 2: 趋势扫描表 (4级均线版) ---
         st.markdown("### 趋势扫描 (Trend Scanner - 4级均线)")
         st.caption("逻辑来源：C(价) > S(20) > M(60) > L(120) > VL(200) = 完美多头")
         
-        df_table = df_plot[["代码", "名称", "组别", "趋势结构", "C/S", "S/M", "M/L", "L/VL", "相对强度", "Z-Score"]].copy()
-        
-        def color_trend(val):
-            color = '#E74C3C' if val < 0 else '#2ECC71' 
-            return f'color: {color}'
+        df_table = df_plot[["代码", "名称", "组别", "趋势结构", "C/S", "S/M", "M/L", "L/VL", "相对强度", "Z-Score"]].sort_values("相对强度", ascending=False) # 只排序一次，各视图复用
         
-        def color_structure(val):
-            if "完美多头" in val: return 'color: #2ECC71; font-weight: bold; border: 1px solid #2ECC71'
-            if "完美空头" in val: return 'color: #E74C3C; font-weight: bold'
-            if "牛市回调" in val: return 'color: #F1C40F; font-weight: bold'
-            return 'color: #ddd'
+        def color_structure(col):
+            # 整列判定：按关键字一次生成样式列，不再逐格调用
+            return np.select(
+                [col.str.contains("完美多头"), col.str.contains("完美空头"), col.str.contains("牛市回调")],
+                ['color: #2ECC71; font-weight: bold; border: 1px solid #2ECC71', 'color: #E74C3C; font-weight: bold', 'color: #F1C40F; font-weight: bold'],
+                'color: #ddd'
+            )
 
         view_mode = st.radio("表格视图", ["汇总模式", "分组模式"], horizontal=True)
-        
-        # 应用样式
         style_cols = ["C/S", "S/M", "M/L", "L/VL", "相对强度"]
         
+        # 整张表的样式矩阵只算一次 (涨跌色 + 结构色)，Styler 整表一次取用，分组视图按行切片复用
+        table_styles = pd.DataFrame('', index=df_table.index, columns=df_table.columns)
+        table_styles[style_cols] = np.where(df_table[style_cols].to_numpy() < 0, 'color: #E74C3C', 'color: #2ECC71')
+        table_styles["趋势结构"] = color_structure(df_table["趋势结构"])
+        
         if view_mode == "汇总模式":
             st.dataframe(
-                df_table.sort_values("相对强度", ascending=False).style.applymap(color_trend, subset=style_cols).applymap(color_structure, subset=["趋势结构"]),
+                df_table.style.apply(lambda _: table_styles, axis=None),
                 use_container_width=True,
                 hide_index=True
             )
@@ -259,9 +200,9 @@ if not raw_data.empty:
             sorted_groups = sorted(selected_groups, key=lambda x: x[0])
             for group in sorted_groups:
                 st.subheader(group)
-                df_sub = df_table[df_table['组别'] == group].sort_values("相对强度", ascending=False)
+                df_sub = df_table[df_table['组别'] == group]
                 st.dataframe(
-                    df_sub.style.applymap(color_trend, subset=style_cols).applymap(color_structure, subset=["趋势结构"]),
+                    df_sub.style.apply(lambda _: table_styles.loc[df_sub.index], axis=None),
                     use_container_width=True,
                     hide_index=True
                 )
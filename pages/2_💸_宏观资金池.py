@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
-import pandas_datareader.data as web
-import yfinance as yf
+import numpy as np
+from data_fetch import PRICE_FRESH_AGE, load_closes, load_fred
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
@@ -12,7 +12,8 @@ st.title("💸 全球流动性时光机 (Liquidity Time Machine)")
 st.caption("全景视角：**【财政+央行】双引擎监控**。看清是谁在主导当下的经济。")
 
 # --- 1. 统一数据引擎 ---
-@st.cache_data(ttl=3600*4)
+# 行情/FRED 都有磁盘缓存，这里只按新鲜期缓存拼装结果，后台刷新后的行情下个周期即生效
+@st.cache_data(ttl=PRICE_FRESH_AGE)
 def get_all_data():
     end_date = datetime.now()
     start_date = end_date - timedelta(days=3650) 
@@ -21,10 +22,10 @@ def get_all_data():
     try:
         # 新增 GFDEBTN (联邦政府总债务) -> 用于计算财政赤字注入
         macro_codes = ['WALCL', 'WTREGEN', 'RRPONTSYD', 'BOGMBASE', 'M1SL', 'M2SL', 'CURRCIR', 'GFDEBTN']
-        df_macro = web.DataReader(macro_codes, 'fred', start_date, end_date)
-        df_macro = df_macro.resample('D').ffill()
-    except:
+        df_macro = load_fred(macro_codes, start_date, end_date)
+    except Exception:
         df_macro = pd.DataFrame()
+    if not df_macro.empty: df_macro = df_macro.resample('D').ffill()
 
     # B. 资产数据
     tickers = {
@@ -35,10 +36,10 @@ def get_all_data():
         "USO": "🛢️ 原油 (USO)"
     }
     try:
-        df_assets = yf.download(list(tickers.keys()), start=start_date, end=end_date, progress=False)['Close']
-        df_assets = df_assets.resample('D').ffill()
-    except:
+        df_assets = load_closes(list(tickers.keys()), start_date, end_date)
+    except Exception:
         df_assets = pd.DataFrame()
+    if not df_assets.empty: df_assets = df_assets.resample('D').ffill()
 
     if not df_macro.empty and df_macro.index.tz is not None: df_macro.index = df_macro.index.tz_localize(None)
     if not df_assets.empty and df_assets.index.tz is not None: df_assets.index = df_assets.index.tz_localize(None)
@@ -69,6 +70,46 @@ def get_all_data():
             
     return df_all
 
+# --- 1.5 时光机图表：只依赖 52 周快照，按内容缓存，重跑时跳过 Plotly 对象构建 ---
+@st.cache_data(ttl=3600*4, max_entries=8, show_spinner=False) # 每次数据刷新都是新键：限时限量，长跑服务不累积旧图
+def build_treemap(df_weekly, latest_row):
+    ids = ["root", "cat_source", "cat_valve", "cat_asset", "m0", "fed", "m2", "m1", "m2_other", "tga", "rrp", "spy", "tlt", "gld", "btc", "uso"]
+    parents = ["", "root", "root", "root", "cat_source", "cat_source", "cat_source", "m2", "m2", "cat_valve", "cat_valve", "cat_asset", "cat_asset", "cat_asset", "cat_asset", "cat_asset"]
+    labels = ["全球资金池", "Source", "Valve", "Asset", "🌱 M0", "🖨️ Fed", "💰 M2", "💧 M1", "🏦 定存", "👜 TGA", "♻️ RRP", "🇺🇸 SPY", "📜 TLT", "🥇 GLD", "₿ BTC", "🛢️ USO"]
+    colors = ["#333", "#2E86C1", "#8E44AD", "#D35400", "#1ABC9C", "#5DADE2", "#2980B9", "#3498DB", "#AED6F1", "#AF7AC5", "#AF7AC5", "#E59866", "#E59866", "#E59866", "#E59866", "#E59866"]
+    LATEST_CAPS = {"M2": 22300, "SPY": 55000, "TLT": 52000, "GLD": 14000, "BTC-USD": 2500, "USO": 2000}
+    # 按列一次性取出周频序列 (缺失记 0)，避免逐周 .loc 标签查找
+    def get_col(col): return df_weekly[col].astype(float).fillna(0.0).to_numpy() if col in df_weekly.columns else np.zeros(len(df_weekly))
+    def get_asset_size(col):
+        last = float(latest_row.get(col, 1))
+        base = LATEST_CAPS.get(col, 100)
+        return base * (get_col(col) / last) if last != 0 else np.full(len(df_weekly), float(base))
+    vals = {'m0': get_col('M0'), 'm1': get_col('M1'), 'm2': get_col('M2'), 'fed': get_col('Fed_Assets'), 'tga': np.abs(get_col('TGA')), 'rrp': np.abs(get_col('RRP')),
+            'spy': get_asset_size('SPY'), 'tlt': get_asset_size('TLT'), 'gld': get_asset_size('GLD'), 'btc': get_asset_size('BTC-USD'), 'uso': get_asset_size('USO')}
+    # 所有节点整列一次算完，得到 [周, 节点] 矩阵 (列顺序与 ids 一致)
+    vals['m2_other'] = np.maximum(0, vals['m2'] - vals['m1']); vals['m2'] = vals['m1'] + vals['m2_other']
+    vals['cat_source'] = vals['m0'] + vals['fed'] + vals['m2']
+    vals['cat_valve'] = vals['tga'] + vals['rrp']
+    vals['cat_asset'] = vals['spy'] + vals['tlt'] + vals['gld'] + vals['btc'] + vals['uso']
+    vals['root'] = vals['cat_source'] + vals['cat_valve'] + vals['cat_asset']
+    node_values = np.column_stack([vals[k] for k in ids])
+    # 动画隔周取一帧 (保留最新一周)，帧数减半，信号不变
+    keep = slice((len(df_weekly) - 1) % 2, None, 2)
+    frames = []
+    steps = []
+    for date, final_values in zip(df_weekly.index[keep], node_values[keep].tolist()):
+        date_str = date.strftime('%Y-%m-%d')
+        text_list = [f"${v/1000:.1f}T" if v > 1000 else f"${v:,.0f}B" for v in final_values]
+        # 帧里只放逐周变化的 values/text，ids/parents/labels 等结构由底图 trace 提供，动画时自动合并
+        frames.append(go.Frame(name=date_str, data=[go.Treemap(values=final_values, text=text_list)]))
+        steps.append(dict(method="animate", args=[[date_str], dict(mode="immediate", frame=dict(duration=300, redraw=True), transition=dict(duration=300))], label=date_str))
+    if not frames:
+        return None
+    fig_tree = go.Figure(data=[go.Treemap(ids=ids, parents=parents, labels=labels, values=frames[-1].data[0].values, text=frames[-1].data[0].text, textinfo="label+text", branchvalues="total", marker=dict(colors=colors), hovertemplate="<b>%{label}</b><br>%{text}<extra></extra>", pathbar=dict(visible=False))], frames=frames)
+    fig_tree.update_layout(height=600, margin=dict(t=0, l=0, r=0, b=0), sliders=[dict(active=len(steps)-1, currentvalue={"prefix": "📅 历史: "}, pad={"t": 50}, steps=steps)], updatemenus=[dict(type="buttons", showactive=False, visible=False)])
+    return fig_tree.to_dict()
+
+
 # --- 2. 页面逻辑 ---
 df = get_all_data()
 
@@ -80,44 +121,17 @@ if not df.empty and 'Net_Liquidity' in df.columns:
     # 占位符：Tab 1 和 Tab 2 的代码逻辑与 V7 版完全一致，请确保不要删除它们
     with tab_treemap:
         # 复用 V7 逻辑
-        ids = ["root", "cat_source", "cat_valve", "cat_asset", "m0", "fed", "m2", "m1", "m2_other", "tga", "rrp", "spy", "tlt", "gld", "btc", "uso"]
-        parents = ["", "root", "root", "root", "cat_source", "cat_source", "cat_source", "m2", "m2", "cat_valve", "cat_valve", "cat_asset", "cat_asset", "cat_asset", "cat_asset", "cat_asset"]
-        labels = ["全球资金池", "Source", "Valve", "Asset", "🌱 M0", "🖨️ Fed", "💰 M2", "💧 M1", "🏦 定存", "👜 TGA", "♻️ RRP", "🇺🇸 SPY", "📜 TLT", "🥇 GLD", "₿ BTC", "🛢️ USO"]
-        colors = ["#333", "#2E86C1", "#8E44AD", "#D35400", "#1ABC9C", "#5DADE2", "#2980B9", "#3498DB", "#AED6F1", "#AF7AC5", "#AF7AC5", "#E59866", "#E59866", "#E59866", "#E59866", "#E59866"]
-        df_weekly = df.resample('W-FRI').last().iloc[-52:]
+        # 周五时间轴只算一次，日线已 ffill，直接按周五对齐取值 (等价于 resample('W-FRI').last()，省掉分组)
+        weekly_idx = pd.date_range(end=df.index[-1] + pd.offsets.Week(weekday=4, n=0), periods=52, freq='W-FRI')
+        df_weekly = df.reindex(weekly_idx[weekly_idx >= df.index[0]], method='ffill')
         latest_row = df.iloc[-1]
-        LATEST_CAPS = {"M2": 22300, "SPY": 55000, "TLT": 52000, "GLD": 14000, "BTC-USD": 2500, "USO": 2000}
-        frames = []
-        steps = []
-        for date in df_weekly.index:
-            date_str = date.strftime('%Y-%m-%d')
-            row = df_weekly.loc[date]
-            vals = {}
-            def get_val(col): return float(row.get(col, 0)) if not pd.isna(row.get(col)) else 0.0
-            def get_asset_size(col):
-                curr = get_val(col)
-                last = float(latest_row.get(col, 1))
-                base = LATEST_CAPS.get(col, 100)
-                return base * (curr / last) if last != 0 else base
-            vals['m0'] = get_val('M0'); vals['m1'] = get_val('M1'); vals['m2'] = get_val('M2'); vals['fed'] = get_val('Fed_Assets')
-            vals['m2_other'] = max(0, vals['m2'] - vals['m1']); vals['m2'] = vals['m1'] + vals['m2_other']
-            vals['tga'] = abs(get_val('TGA')); vals['rrp'] = abs(get_val('RRP'))
-            vals['spy'] = get_asset_size('SPY'); vals['tlt'] = get_asset_size('TLT'); vals['gld'] = get_asset_size('GLD')
-            vals['btc'] = get_asset_size('BTC-USD'); vals['uso'] = get_asset_size('USO')
-            vals['cat_source'] = vals['m0'] + vals['fed'] + vals['m2']
-            vals['cat_valve'] = vals['tga'] + vals['rrp']
-            vals['cat_asset'] = vals['spy'] + vals['tlt'] + vals['gld'] + vals['btc'] + vals['uso']
-            vals['root'] = vals['cat_source'] + vals['cat_valve'] + vals['cat_asset']
-            final_values = [vals['root'], vals['cat_source'], vals['cat_valve'], vals['cat_asset'], vals['m0'], vals['fed'], vals['m2'], vals['m1'], vals['m2_other'], vals['tga'], vals['rrp'], vals['spy'], vals['tlt'], vals['gld'], vals['btc'], vals['uso']]
-            text_list = [f"${v/1000:.1f}T" if v > 1000 else f"${v:,.0f}B" for v in final_values]
-            frames.append(go.Frame(name=date_str, data=[go.Treemap(ids=ids, parents=parents, values=final_values, labels=labels, text=text_list, branchvalues="total")]))
-            steps.append(dict(method="animate", args=[[date_str], dict(mode="immediate", frame=dict(duration=300, redraw=True), transition=dict(duration=300))], label=date_str))
-        if frames:
-            fig_tree = go.Figure(data=[go.Treemap(ids=ids, parents=parents, labels=labels, values=frames[-1].data[0].values, text=frames[-1].data[0].text, textinfo="label+text", branchvalues="total", marker=dict(colors=colors), hovertemplate="<b>%{label}</b><br>%{text}<extra></extra>", pathbar=dict(visible=False))], frames=frames)
-            fig_tree.update_layout(height=600, margin=dict(t=0, l=0, r=0, b=0), sliders=[dict(active=len(steps)-1, currentvalue={"prefix": "📅 历史: "}, pad={"t": 50}, steps=steps)], updatemenus=[dict(type="buttons", showactive=False, visible=False)])
+        fig_tree = build_treemap(df_weekly, latest_row)
+        if fig_tree is not None:
             st.plotly_chart(fig_tree, use_container_width=True)
 
-    with tab_waterfall:
+    # 各 Tab 的控件只重跑自己的片段 (fragment)，不再牵连整页重建时光机动画
+    @st.fragment
+    def render_waterfall():
         available_dates = df_weekly.index.strftime('%Y-%m-%d').tolist()
         sankey_date_str = st.select_slider("选择时间点：", options=available_dates, value=available_dates[-1], key="sankey_slider_v2")
         curr_date = pd.to_datetime(sankey_date_str)
@@ -141,7 +155,8 @@ if not df.empty and 'Net_Liquidity' in df.columns:
     # ==========================================
     # PROJECT 3: 趋势相关性 (Trend Overlay) - NEW MODE
     # ==========================================
-    with tab_corr:
+    @st.fragment
+    def render_trend():
         st.markdown("##### 📈 寻找“鳄鱼嘴”：资金与资产的背离")
         
         col_ctrl1, col_ctrl2 = st.columns([1, 3])
@@ -152,12 +167,13 @@ if not df.empty and 'Net_Liquidity' in df.columns:
         
         df_chart = df.iloc[-lookback_days:].copy()
         
+        # 最长 10 年日线 × 3 条线，用 WebGL 绘制，缩放/悬停不再卡 SVG
         fig_trend = make_subplots(specs=[[{"secondary_y": True}]])
         
         if chart_mode == "双轴叠加 (看背离)":
-            fig_trend.add_trace(go.Scatter(x=df_chart.index, y=df_chart['Net_Liquidity'], name="💧 净流动性 (左轴)", fill='tozeroy', line=dict(color='rgba(46, 204, 113, 0.5)', width=0)), secondary_y=False)
-            fig_trend.add_trace(go.Scatter(x=df_chart.index, y=df_chart['SPY'], name="🇺🇸 美股 SPY (右轴)", line=dict(color='#E74C3C', width=2)), secondary_y=True)
-            fig_trend.add_trace(go.Scatter(x=df_chart.index, y=df_chart['BTC-USD'], name="₿ 比特币 (右轴)", line=dict(color='#F39C12', width=2)), secondary_y=True)
+            fig_trend.add_trace(go.Scattergl(x=df_chart.index, y=df_chart['Net_Liquidity'], name="💧 净流动性 (左轴)", fill='tozeroy', line=dict(color='rgba(46, 204, 113, 0.5)', width=0)), secondary_y=False)
+            fig_trend.add_trace(go.Scattergl(x=df_chart.index, y=df_chart['SPY'], name="🇺🇸 美股 SPY (右轴)", line=dict(color='#E74C3C', width=2)), secondary_y=True)
+            fig_trend.add_trace(go.Scattergl(x=df_chart.index, y=df_chart['BTC-USD'], name="₿ 比特币 (右轴)", line=dict(color='#F39C12', width=2)), secondary_y=True)
             fig_trend.update_yaxes(title_text="净流动性 ($B)", secondary_y=False)
             
         elif chart_mode == "央行 vs 财政 (看对决)":
@@ -166,13 +182,13 @@ if not df.empty and 'Net_Liquidity' in df.columns:
             # 右轴：美国国债总额 (代表财政扩张程度)
             
             fig_trend.add_trace(
-                go.Scatter(x=df_chart.index, y=df_chart['Fed_Assets'], name="🏛️ 美联储资产 (央行)", 
+                go.Scattergl(x=df_chart.index, y=df_chart['Fed_Assets'], name="🏛️ 美联储资产 (央行)", 
                            line=dict(color='#F1C40F', width=3), hovertemplate="$%{y:.2f}T"),
                 secondary_y=False
             )
             
             fig_trend.add_trace(
-                go.Scatter(x=df_chart.index, y=df_chart['Total_Debt'], name="🦅 美国国债总额 (财政)", 
+                go.Scattergl(x=df_chart.index, y=df_chart['Total_Debt'], name="🦅 美国国债总额 (财政)", 
                            line=dict(color='#E74C3C', width=3, dash='dash'), hovertemplate="$%{y:.2f}T"),
                 secondary_y=True
             )
@@ -183,9 +199,9 @@ if not df.empty and 'Net_Liquidity' in df.columns:
             
         else: # 归一化
             def normalize(series): return (series / series.iloc[0] - 1) * 100
-            fig_trend.add_trace(go.Scatter(x=df_chart.index, y=normalize(df_chart['Net_Liquidity']), name="💧 净流动性 %", line=dict(color='#2ECC71', width=3)))
-            fig_trend.add_trace(go.Scatter(x=df_chart.index, y=normalize(df_chart['Total_Debt']), name="🦅 国债总额 %", line=dict(color='#E74C3C', width=3, dash='dash')))
-            fig_trend.add_trace(go.Scatter(x=df_chart.index, y=normalize(df_chart['SPY']), name="🇺🇸 美股 %", line=dict(color='#3498DB', width=2)))
+            fig_trend.add_trace(go.Scattergl(x=df_chart.index, y=normalize(df_chart['Net_Liquidity']), name="💧 净流动性 %", line=dict(color='#2ECC71', width=3)))
+            fig_trend.add_trace(go.Scattergl(x=df_chart.index, y=normalize(df_chart['Total_Debt']), name="🦅 国债总额 %", line=dict(color='#E74C3C', width=3, dash='dash')))
+            fig_trend.add_trace(go.Scattergl(x=df_chart.index, y=normalize(df_chart['SPY']), name="🇺🇸 美股 %", line=dict(color='#3498DB', width=2)))
             fig_trend.update_yaxes(title_text="累计涨跌幅 (%)")
         
         fig_trend.update_layout(height=600, hovermode="x unified", legend=dict(orientation="h", y=1.1, x=0.5, xanchor="center"), margin=dict(t=0, l=10, r=10, b=10))
@@ -202,5 +218,11 @@ if not df.empty and 'Net_Liquidity' in df.columns:
             else:
                 st.info("观察绿色（流动性）与红色（股市）的背离程度。")
 
+    with tab_waterfall:
+        render_waterfall()
+
+    with tab_corr:
+        render_trend()
+
 else:
     st.info("⏳ 正在拉取宏观对决数据...")
\ No newline at end of file
@@ -0,0 +1,119 @@
+# radar_engine.py
+# 雷达计算引擎：宏观全景雷达 / 自选股池共用的 Z-Score、相对强度、EMA 乖离率
+# 输入收盘价宽表 (行 = 日期, 列 = 代码)，输出按代码索引的指标表；结构标签、名称/分组由各页面自行拼接
+# 雷达散点图的按组拆轨迹/组别切换也放在这里，图表样式 (色阶、标题、点大小) 由各页面决定
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+
+def align_tail(close):
+    # 各资产交易日历不同 (BTC 周末也有报价)，把每列的有效值压到底部对齐，
+    # 等价于逐列 dropna 后按尾部取数，之后即可整表向量化计算
+    arr = close.to_numpy(dtype=float)
+    order = np.argsort(~np.isnan(arr), axis=0, kind='stable')
+    return pd.DataFrame(np.take_along_axis(arr, order, axis=0), columns=close.columns)
+
+
+def ema_last(arr, span):
+    # adjust=False 的 EMA 是线性递推，只要最后一个值时可写成一次加权点积 (不生成整条序列):
+    # y = x_s + Σ α(1-α)^(T-1-t)·(x_t - x_s) (t ≥ s)，s 为各列首个有效值 (对齐后其上全是 NaN)
+    # 先减去 x_s 再求和：权重总和恰为 1 的部分不参与浮点累加，常数序列得到的就是 x_s 本身 (乖离率恰为 0)，
+    # 高价标的 (如 BTC) 也只对偏离量做累加，与 ewm(span, adjust=False).mean() 的末值一致到舍入误差
+    T = len(arr)
+    alpha = 2 / (span + 1)
+    decay = (1 - alpha) ** np.arange(T - 1, -1, -1)
+    first = np.argmax(~np.isnan(arr), axis=0)
+    x0 = arr[first, np.arange(arr.shape[1])]
+    return x0 + alpha * (decay @ np.nan_to_num(arr - x0))
+
+
+def classify_structure(stats, labels):
+    # 按 4 级乖离率整列判定趋势结构，np.select 依序匹配，等价于逐行 if/elif
+    # labels 依次为: 完美多头, 完美空头, 牛市回调, 长期看涨, 熊市反弹, 长期看跌, 震荡 (文案由页面决定)
+    c_s, s_m, m_l, l_vl = (stats[col].to_numpy() for col in ("C/S", "S/M", "M/L", "L/VL"))
+    conds = [
+        (c_s > 0) & (s_m > 0) & (m_l > 0) & (l_vl > 0),
+        (c_s < 0) & (s_m < 0) & (m_l < 0) & (l_vl < 0),
+        (l_vl > 0) & (c_s < 0),
+        l_vl > 0,
+        (l_vl < 0) & (c_s > 0),
+        l_vl < 0,
+    ]
+    return np.select(conds, labels[:-1], default=labels[-1])
+
+
+def split_group_traces(fig, groups):
+    # 连续色轴下 px 只产出一条轨迹：按组别拆成共用色轴的多条轨迹，切换筛选时只改 visible，不再重跑 px.scatter
+    # groups 为与绘图数据逐行对应的分类列 (组别)，每个类别一条轨迹
+    base, labels = fig.data[0], groups.to_numpy()
+    traces = []
+    for group in groups.cat.categories:
+        m = labels == group
+        traces.append(go.Scattergl(base, name=group, x=base.x[m], y=base.y[m], text=base.text[m], customdata=base.customdata[m], marker_color=base.marker.color[m]))
+    return go.Figure(traces, fig.layout).to_dict()
+
+
+def show_radar_groups(fig, df_plot, selected_groups):
+    # fig 为缓存底图的副本：按所选组别切换轨迹可见性，象限标注随筛选后的数据范围重算
+    for trace in fig["data"]:
+        trace["visible"] = trace["name"] in selected_groups
+
+    if not df_plot.empty:
+        # 象限边界一次聚合取出，再统一做最小范围钳制
+        (min_x, max_x), (min_y, max_y) = df_plot[['Z-Score', '相对强度']].agg(['min', 'max']).T.to_numpy().tolist()
+        min_x, max_x, min_y, max_y = min(min_x, -2), max(max_x, 2), min(min_y, -5), max(max_y, 5)
+        fig["layout"].setdefault("annotations", []).extend([
+            dict(x=max_x, y=max_y, text="领涨/拥挤", showarrow=False, font=dict(color="#E74C3C", size=12)),
+            dict(x=min_x, y=min_y, text="滞涨/弱势", showarrow=False, font=dict(color="#3498DB", size=12)),
+            dict(x=min_x, y=max_y, text="抗跌/启动", showarrow=False, font=dict(color="#2ECC71", size=12)),
+            dict(x=max_x, y=min_y, text="补跌/崩盘", showarrow=False, font=dict(color="#E67E22", size=12)),
+        ])
+    return fig
+
+
+def compute_radar(raw_data, window=250, mom_lookback=20):
+    close = align_tail(raw_data)
+
+    # 基准 SPY 的 20 日动量 (数据不足时降级为 0)
+    # 对齐后有效值都在底部：回看位置非 NaN 即说明历史足够，取一次数组即可，不再 count/iloc 各走一遍
+    spy_mom20 = 0
+    if 'SPY' in close.columns and len(close) > mom_lookback:
+        spy = close['SPY'].to_numpy()
+        if not np.isnan(spy[-(mom_lookback + 1)]):
+            spy_mom20 = (spy[-1] / spy[-(mom_lookback + 1)] - 1) * 100
+
+    close = close.loc[:, close.count() >= window] # 历史不足一个窗口的标的不参与 (EMA200 也需要足够长度)
+    if close.empty:
+        # 数据源部分故障时可能整表都不够长：返回空表，由页面提示暂无数据，而不是在下面按位置取行时越界
+        cols = ["Z-Score", "相对强度", "绝对涨幅", "C/S", "S/M", "M/L", "L/VL", "现价"]
+        return pd.DataFrame(columns=cols, index=close.columns, dtype=float), spy_mom20
+
+    arr = close.to_numpy() # [T, N] 连续数组，以下全部按整数位置取行/取窗口
+    curr = arr[-1]
+
+    # --- A. Z-Score ---
+    # 只需最后一个窗口：对尾部 window 行直接做 numpy 归约 (对齐后均为有效值)，不再生成整条 rolling 序列
+    tail = arr[-window:]
+    ma = tail.mean(axis=0)
+    std = tail.std(axis=0, ddof=1)
+    z_score = np.divide(curr - ma, std, out=np.zeros_like(curr), where=std != 0)
+
+    # --- B. 相对强度 ---
+    abs_mom = (curr / arr[-(mom_lookback + 1)] - 1) * 100
+    rel_mom = abs_mom - spy_mom20
+
+    # --- C. EMA 系统 (20/60/120/200) 与乖离率 ---
+    ema20, ema60, ema120, ema200 = (ema_last(arr, span) for span in (20, 60, 120, 200))
+    stats = pd.DataFrame({
+        "Z-Score": z_score,
+        "相对强度": rel_mom,
+        "绝对涨幅": abs_mom,
+        "C/S": (curr - ema20) / ema20 * 100,      # Close vs Short (20)
+        "S/M": (ema20 - ema60) / ema60 * 100,     # Short (20) vs Medium (60)
+        "M/L": (ema60 - ema120) / ema120 * 100,   # Medium (60) vs Long (120)
+        "L/VL": (ema120 - ema200) / ema200 * 100, # Long (120) vs Very Long (200)
+        "现价": curr
+    }, index=close.columns)
+    return stats, spy_mom20
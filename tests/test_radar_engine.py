@@ -0,0 +1,42 @@
+# ema_last 是 ewm(span, adjust=False).mean() 末值的闭式写法，这里以 pandas 逐步递推为基准校验
+# 常数序列必须得到恰好相同的值 (乖离率恰为 0 才会判为 "震荡")；高价标的 (BTC 量级) 只允许舍入误差
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from radar_engine import align_tail, classify_structure, compute_radar, ema_last
+
+SPANS = (20, 60, 120, 200)
+LABELS = ["完美多头", "完美空头", "牛市回调", "长期看涨", "熊市反弹", "长期看跌", "震荡"]
+
+
+def _ewm_last(close, span):
+    return np.array([close[c].dropna().ewm(span=span, adjust=False).mean().iloc[-1] for c in close.columns])
+
+
+def test_ema_last_constant_column_is_exact():
+    close = pd.DataFrame({"FLAT": np.full(400, 37.3), "LATE": np.r_[np.full(150, np.nan), np.full(250, 64123.57)]})
+    arr = align_tail(close).to_numpy()
+    for span in SPANS:
+        np.testing.assert_array_equal(ema_last(arr, span), _ewm_last(close, span))
+
+
+def test_ema_last_high_priced_column_matches_ewm():
+    rng = np.random.default_rng(7)
+    btc = 60000 * np.exp(np.cumsum(rng.normal(0, 0.03, 730)))
+    close = pd.DataFrame({"BTC-USD": btc, "SPY": np.r_[np.full(230, np.nan), 500 + np.cumsum(rng.normal(0, 3, 500))]})
+    arr = align_tail(close).to_numpy()
+    for span in SPANS:
+        np.testing.assert_allclose(ema_last(arr, span), _ewm_last(close, span), rtol=1e-12)
+
+
+def test_constant_series_classified_as_range():
+    idx = pd.date_range("2024-01-01", periods=300)
+    raw = pd.DataFrame({"SPY": np.linspace(400, 500, 300), "FLAT": np.full(300, 64123.57)}, index=idx)
+    stats, _ = compute_radar(raw)
+    assert (stats.loc["FLAT", ["C/S", "S/M", "M/L", "L/VL"]] == 0).all()
+    assert classify_structure(stats, LABELS).tolist() == ["完美多头", "震荡"]